@@ -3,6 +3,7 @@ CREATE TABLE IF NOT EXISTS capabilities (
     description TEXT NOT NULL,
     file_path TEXT NOT NULL,
     tool_schema JSONB NOT NULL,
+    code_hash TEXT,
     created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
     updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
 );
@@ -26,6 +27,14 @@ CREATE TABLE IF NOT EXISTS conversations (
 
 CREATE INDEX IF NOT EXISTS idx_conversations_thread_id ON conversations(thread_id);
 
+-- Matches the per-thread history read (WHERE thread_id = $1 ORDER BY id DESC
+-- LIMIT $2) so it walks the index instead of sorting a growing heap scan.
+CREATE INDEX IF NOT EXISTS idx_conversations_thread_id_id_desc ON conversations(thread_id, id DESC);
+
+-- First-user-message lookups (thread list preview) become a single index
+-- descent per thread.
+CREATE INDEX IF NOT EXISTS idx_conversations_thread_role_id ON conversations(thread_id, role, id);
+
 CREATE TABLE IF NOT EXISTS tasks (
     id SERIAL PRIMARY KEY,
     title TEXT NOT NULL,
@@ -35,3 +44,7 @@ CREATE TABLE IF NOT EXISTS tasks (
     created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
     updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
 );
+
+-- Partial index for the due-tasks prompt query; only pending rows qualify,
+-- so the index stays tiny no matter how many tasks are completed.
+CREATE INDEX IF NOT EXISTS idx_tasks_pending_due ON tasks (due_at NULLS LAST) WHERE status = 'pending';
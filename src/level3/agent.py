@@ -1,35 +1,54 @@
 from __future__ import annotations
 
-import json
+import asyncio
 import logging
 import sys
 from collections.abc import AsyncGenerator
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Any
 
 import asyncpg
+import orjson
 from openai import AsyncOpenAI
 from openai.types.chat import ChatCompletionMessageParam, ChatCompletionToolParam
 
 from level3.bootstrap_tools import BOOTSTRAP_TOOLS, ToolDefinition
-from level3.capability_loader import get_loaded_capabilities
+from level3.capability_loader import (
+    get_capabilities_section,
+    get_capabilities_version,
+    get_loaded_capabilities,
+)
 from level3.config import Settings
-from level3.db import execute_query, rows_to_json
-from level3.llm import chat
+from level3.db import execute_many, execute_query, rows_to_json
+from level3.llm import chat_stream
 
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+def _loads(data: str | bytes) -> Any:
+    return orjson.loads(data)
+
+
+def _dumps(obj: Any) -> str:
+    return orjson.dumps(obj).decode()
+
+
+@dataclass(slots=True)
 class AgentEvent:
-    type: str  # "assistant", "tool_call", "tool_result", "error"
+    type: str  # "assistant", "assistant_delta", "tool_call", "tool_result", "error"
     content: str
     name: str | None = None
     arguments: dict[str, Any] | None = None
 
 
 
-SYSTEM_PROMPT_TEMPLATE = """You are Level 3 — a self-evolving personal assistant.
+# The system prompt is split into segments ordered static-first, dynamic-last
+# so provider prompt caching can reuse the KV state for the invariant prefix.
+# STATIC_RULES never changes; capabilities change rarely; tasks change
+# minute-to-minute, so they go at the very end.
+
+STATIC_RULES = """You are Level 3 — a self-evolving personal assistant.
 
 What makes you different: you can build your own tools, modify your own code, and grow
 more capable over time. Every capability you create becomes a permanent part of who you
@@ -47,8 +66,6 @@ something could be done better. You're an assistant with agency, not a yes-machi
 ## Your toolkit
 You have 4 bootstrap tools: execute_sql, write_capability, manage_tasks, restart.
 
-{capabilities_section}
-
 ## When to build vs. just answer
 Most requests do NOT need a new capability. Have conversations, answer questions, use
 existing tools. Only build a capability when:
@@ -64,11 +81,9 @@ If a capability errors, fix it — don't create a separate debug tool.
 - Remember: every tool you build makes you permanently more capable. Take pride in that.
 - You can read and modify your own source code. That's a superpower — use it wisely.
 
-{tasks_section}
-
 When making function calls using tools that accept array or object parameters ensure those are structured using JSON. For example:
 <example_tool_call>
-example_complex_tool(parameter=[{{"color": "orange", "options": {{"option_key_1": true, "option_key_2": "value"}}}}, {{"color": "purple", "options": {{"option_key_1": true, "option_key_2": "value"}}}}])
+example_complex_tool(parameter=[{"color": "orange", "options": {"option_key_1": true, "option_key_2": "value"}}, {"color": "purple", "options": {"option_key_1": true, "option_key_2": "value"}}])
 </example_tool_call>
 
 Answer the user's request using the relevant tool(s), if they are available. Check that all the required parameters for each tool call are provided or can reasonably be inferred from context. IF there are no relevant tools or there are missing values for required parameters, ask the user to supply these values; otherwise proceed with the tool calls. If the user provides a specific value for a parameter (for example provided in quotes), make sure to use that value EXACTLY. DO NOT make up values for or ask about optional parameters.
@@ -76,43 +91,90 @@ Answer the user's request using the relevant tool(s), if they are available. Che
 If you intend to call multiple tools and there are no dependencies between the calls, make all of the independent calls in the same turn, otherwise you MUST wait for previous calls to finish first to determine the dependent values (do NOT use placeholders or guess missing parameters)."""
 
 
+# The last-N window is ordered and aggregated server-side so Python receives
+# one JSON document instead of N rows to re-parse and reverse.  LIMIT is a
+# bind parameter so Postgres can cache the plan.
+_HISTORY_SQL = """
+WITH recent AS (
+    SELECT id, role, content, tool_call_id, tool_calls
+    FROM conversations
+    WHERE thread_id = $1
+    ORDER BY id DESC
+    LIMIT $2
+)
+SELECT jsonb_agg(to_jsonb(recent) ORDER BY id) AS history FROM recent
+"""
+
+# Hot-path statements are module constants so the query text is byte-identical
+# on every call — that's what asyncpg's per-connection prepared-statement
+# cache keys on, so each connection parses and plans them only once.
+_TASKS_SQL = (
+    "SELECT id, title, details, status, due_at FROM tasks "
+    "WHERE status = 'pending' AND (due_at IS NULL OR due_at <= now() + interval '1 hour') "
+    "ORDER BY due_at NULLS LAST LIMIT 10"
+)
+_INSERT_USER_SQL = "INSERT INTO conversations (thread_id, role, content) VALUES ($1, $2, $3)"
+_TOUCH_THREAD_SQL = "UPDATE conversation_threads SET updated_at = now() WHERE id = $1"
+
+
 async def _load_context(
     pool: asyncpg.Pool[asyncpg.Record],
     settings: Settings,
     thread_id: int,
-) -> tuple[list[ChatCompletionMessageParam], str]:
-    """Load recent conversation history and build system prompt context."""
-    # Recent messages scoped to this thread
-    rows = await execute_query(
-        pool,
-        "SELECT role, content, tool_call_id, tool_calls FROM conversations "
-        "WHERE thread_id = $1 "
-        f"ORDER BY id DESC LIMIT {settings.max_conversation_history}",
-        [thread_id],
+) -> list[ChatCompletionMessageParam]:
+    """Build the full messages list: system prompt segments plus recent history.
+
+    The user message is already persisted before this runs, so it arrives as
+    the tail of the history — the caller sends the returned list as-is.
+    """
+    # Fire both reads concurrently — they're independent, so wall time is the
+    # slower of the two queries instead of the sum.
+    rows, task_rows = await asyncio.gather(
+        # Recent messages scoped to this thread
+        execute_query(
+            pool,
+            _HISTORY_SQL,
+            [thread_id, settings.max_conversation_history],
+        ),
+        # Due tasks
+        execute_query(pool, _TASKS_SQL),
     )
-    raw_history: list[dict[str, Any]] = []
-    if isinstance(rows, list):
-        for row in reversed(rows):
-            # Parse tool_calls — asyncpg returns JSONB as strings
-            raw_tc = row.get("tool_calls")
-            tool_calls_list: list[dict[str, Any]] | None = None
-            if raw_tc:
-                tool_calls_list = json.loads(raw_tc) if isinstance(raw_tc, str) else raw_tc
-
-            msg: dict[str, Any] = {"role": row["role"]}
-
-            # For assistant messages with tool_calls and no text, omit content
-            # entirely — some providers reject null, others reject empty string.
-            if tool_calls_list and not row["content"]:
-                pass
-            else:
-                msg["content"] = row["content"]
-
-            if row.get("tool_call_id"):
-                msg["tool_call_id"] = row["tool_call_id"]
-            if tool_calls_list:
-                msg["tool_calls"] = tool_calls_list
-            raw_history.append(msg)
+    # The jsonb codec on the pool hands the aggregate back pre-decoded
+    raw_rows: list[dict[str, Any]] = []
+    if isinstance(rows, list) and rows:
+        raw_rows = rows[0].get("history") or []
+
+    # Fill a preallocated list by index rather than growing with append —
+    # every key is present in the jsonb aggregate (nulls included), so plain
+    # subscripting is safe and faster than .get here.
+    raw_history: list[dict[str, Any]] = [{}] * len(raw_rows)
+    for i, row in enumerate(raw_rows):
+        # tool_calls arrives pre-decoded — it's nested jsonb inside the
+        # aggregate, not a string column.
+        tool_calls_list: list[dict[str, Any]] | None = row["tool_calls"]
+
+        msg: dict[str, Any] = {"role": row["role"]}
+
+        # For assistant messages with tool_calls and no text, omit content
+        # entirely — some providers reject null, others reject empty string.
+        if tool_calls_list and not row["content"]:
+            pass
+        else:
+            msg["content"] = row["content"]
+
+        if row["tool_call_id"]:
+            msg["tool_call_id"] = row["tool_call_id"]
+        if tool_calls_list:
+            msg["tool_calls"] = tool_calls_list
+        raw_history[i] = msg
+
+    # Assemble the outgoing messages list directly — system segments first,
+    # then sanitized history appended in place, so the caller never has to
+    # splice (and copy) the history again.
+    tasks_json = rows_to_json(task_rows) if isinstance(task_rows, list) and task_rows else ""
+    messages: list[ChatCompletionMessageParam] = [
+        *_system_messages(get_capabilities_version(), tasks_json),
+    ]
 
     # Sanitize history — the API requires every assistant message with
     # tool_calls to be immediately followed by matching tool result messages.
@@ -120,7 +182,6 @@ async def _load_context(
     # crashes, or interrupted restarts.  Walk the history and collect the
     # tool_call IDs we expect results for; drop any exchange that is
     # incomplete.
-    history: list[ChatCompletionMessageParam] = []
     i = 0
     while i < len(raw_history):
         msg = raw_history[i]
@@ -144,7 +205,7 @@ async def _load_context(
             if expected_ids == found_ids:
                 # Complete exchange — keep it all
                 for k in range(i, j):
-                    history.append(raw_history[k])  # type: ignore[arg-type]
+                    messages.append(raw_history[k])  # type: ignore[arg-type]
                 i = j
             else:
                 # Incomplete — skip the assistant msg and any partial results
@@ -152,55 +213,105 @@ async def _load_context(
             continue
 
         # Regular message (user or text-only assistant) — keep it
-        history.append(msg)  # type: ignore[arg-type]
+        messages.append(msg)  # type: ignore[arg-type]
         i += 1
 
-    # Capabilities
-    caps = get_loaded_capabilities()
-    if caps:
-        cap_lines = [f"- {name}: {td.description}" for name, td in caps.items()]
-        capabilities_section = f"You have {len(caps)} self-built capabilities:\n" + "\n".join(
-            cap_lines
-        )
-    else:
-        capabilities_section = "You have no self-built capabilities yet."
-
-    # Due tasks
-    task_rows = await execute_query(
-        pool,
-        "SELECT id, title, details, status, due_at FROM tasks "
-        "WHERE status = 'pending' AND (due_at IS NULL OR due_at <= now() + interval '1 hour') "
-        "ORDER BY due_at NULLS LAST LIMIT 10",
-    )
-    if isinstance(task_rows, list) and task_rows:
-        tasks_section = "Current tasks due soon:\n" + rows_to_json(task_rows)
-    else:
-        tasks_section = ""
-
-    system_prompt = SYSTEM_PROMPT_TEMPLATE.format(
-        capabilities_section=capabilities_section,
-        tasks_section=tasks_section,
+    return messages
+
+
+@lru_cache(maxsize=16)
+def _system_messages(
+    caps_version: int,
+    tasks_json: str,
+) -> tuple[ChatCompletionMessageParam, ...]:
+    """Render the system message segments, cached on (caps version, tasks).
+
+    Tasks churn minute-to-minute but repeat across adjacent turns, so nearby
+    turns reuse the same tuple (and the same object identities) instead of
+    re-rendering.  The returned dicts are never mutated downstream.
+    """
+    segments: tuple[ChatCompletionMessageParam, ...] = (
+        {"role": "system", "content": STATIC_RULES},
+        {"role": "system", "content": get_capabilities_section()},
     )
+    if tasks_json:
+        segments += ({"role": "system", "content": "Current tasks due soon:\n" + tasks_json},)
+    return segments
 
-    return history, system_prompt
+
+# Memoized tool assembly — rebuilding is only needed when the capability
+# registry changes, and keeping the schemas list identity stable means the
+# serialized tools payload stays byte-identical across turns (which also
+# preserves the provider's prompt-cache prefix).
+#
+# Bootstrap tools never change at runtime, so their schema list and map are
+# built once at import; a cache miss only appends the capability tail.  The
+# OpenAI SDK consumes dicts, so the decoded structures are what we cache —
+# the win is skipping the per-call rebuild, not the serialization itself.
+_BOOTSTRAP_SCHEMAS: list[ChatCompletionToolParam] = [
+    td.schema  # type: ignore[misc]
+    for td in BOOTSTRAP_TOOLS
+]
+_BOOTSTRAP_MAP: dict[str, ToolDefinition] = {td.name: td for td in BOOTSTRAP_TOOLS}
+
+_tools_cache: tuple[int, list[ChatCompletionToolParam], dict[str, ToolDefinition]] | None = None
 
 
 def _collect_tools() -> tuple[list[ChatCompletionToolParam], dict[str, ToolDefinition]]:
     """Collect all tool definitions (bootstrap + capabilities)."""
-    tool_map: dict[str, ToolDefinition] = {}
-    schemas: list[ChatCompletionToolParam] = []
+    global _tools_cache  # noqa: PLW0603
 
-    for td in BOOTSTRAP_TOOLS:
-        tool_map[td.name] = td
-        schemas.append(td.schema)  # type: ignore[arg-type]
+    version = get_capabilities_version()
+    if _tools_cache is not None and _tools_cache[0] == version:
+        return _tools_cache[1], _tools_cache[2]
+
+    schemas: list[ChatCompletionToolParam] = [*_BOOTSTRAP_SCHEMAS]
+    tool_map: dict[str, ToolDefinition] = dict(_BOOTSTRAP_MAP)
 
     for name, td in get_loaded_capabilities().items():
         tool_map[name] = td
         schemas.append(td.schema)  # type: ignore[arg-type]
 
+    _tools_cache = (version, schemas, tool_map)
     return schemas, tool_map
 
 
+_INSERT_CONVERSATION_SQL = (
+    "INSERT INTO conversations (thread_id, role, content, tool_call_id, tool_calls) "
+    "VALUES ($1, $2, $3, $4, $5::jsonb)"
+)
+
+# (thread_id, role, content, tool_call_id, tool_calls)
+ConversationRow = tuple[int, str, str, str | None, list[dict[str, Any]] | None]
+
+
+async def _execute_tool(
+    tool_def: ToolDefinition | None,
+    fn_name: str,
+    fn_args: dict[str, Any],
+    pool: asyncpg.Pool[asyncpg.Record],
+) -> str:
+    """Run one tool call, returning its result (or a JSON error) as a string."""
+    if not tool_def:
+        return _dumps({"error": f"unknown tool: {fn_name}"})
+    try:
+        return await tool_def.execute(fn_args, pool)
+    except Exception as e:
+        logger.exception("Tool execution error: %s", fn_name)
+        return _dumps({"error": str(e)})
+
+
+async def _flush_conversation_rows(
+    pool: asyncpg.Pool[asyncpg.Record],
+    rows: list[ConversationRow],
+) -> None:
+    """Persist buffered conversation rows in a single executemany round-trip."""
+    if not rows:
+        return
+    await execute_many(pool, _INSERT_CONVERSATION_SQL, rows)  # type: ignore[arg-type]
+    rows.clear()
+
+
 async def handle_message(
     user_message: str,
     pool: asyncpg.Pool[asyncpg.Record],
@@ -210,46 +321,101 @@ async def handle_message(
 ) -> AsyncGenerator[AgentEvent]:
     """Process a user message through the agent loop, yielding events."""
     # Save user message
-    await execute_query(
-        pool,
-        "INSERT INTO conversations (thread_id, role, content) VALUES ($1, $2, $3)",
-        [thread_id, "user", user_message],
-    )
+    await execute_query(pool, _INSERT_USER_SQL, [thread_id, "user", user_message])
 
     # Update thread timestamp
-    await execute_query(
-        pool,
-        "UPDATE conversation_threads SET updated_at = now() WHERE id = $1",
-        [thread_id],
-    )
+    await execute_query(pool, _TOUCH_THREAD_SQL, [thread_id])
 
-    history, system_prompt = await _load_context(pool, settings, thread_id)
+    messages = await _load_context(pool, settings, thread_id)
     tool_schemas, tool_map = _collect_tools()
 
-    messages: list[ChatCompletionMessageParam] = [
-        {"role": "system", "content": system_prompt},
-        *history,
-    ]
+    # Rows produced during a round are buffered and flushed in one
+    # executemany round-trip instead of an INSERT per row.  The user message
+    # above stays inline so it's durable before the first LLM call.
+    #
+    # Flushes run as background tasks so persistence overlaps the next LLM
+    # call instead of sitting on the critical path.  Tasks are chained (each
+    # awaits its predecessor) to keep insertion order, and drained before the
+    # generator returns so nothing is lost.
+    pending_rows: list[ConversationRow] = []
+    pending_writes: set[asyncio.Task[None]] = set()
+    prev_flush: asyncio.Task[None] | None = None
+
+    def _on_flush_done(task: asyncio.Task[None]) -> None:
+        # Logging happens here — once per task, as soon as it settles — so a
+        # flush that fails mid-turn is reported even though it has left
+        # pending_writes by the time _drain_writes runs.
+        pending_writes.discard(task)
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            logger.error("Conversation persistence failed: %s", exc)
+
+    def _spawn_flush() -> None:
+        nonlocal prev_flush
+        if not pending_rows:
+            return
+        rows = list(pending_rows)
+        pending_rows.clear()
+        prev = prev_flush
+
+        async def _run() -> None:
+            if prev is not None:
+                # Order only; the predecessor's failure is logged by its own
+                # done callback.
+                await asyncio.gather(prev, return_exceptions=True)
+            await _flush_conversation_rows(pool, rows)
+
+        task = asyncio.create_task(_run())
+        prev_flush = task
+        pending_writes.add(task)
+        task.add_done_callback(_on_flush_done)
+
+    async def _drain_writes() -> None:
+        if not pending_writes:
+            return
+        # Completion barrier only — failures are logged per task by
+        # _on_flush_done.
+        await asyncio.gather(*pending_writes, return_exceptions=True)
 
     for _iteration in range(settings.max_tool_iterations):
+        # Stream the completion — emit text deltas as they arrive so the UI
+        # renders incrementally instead of waiting for the full response.
+        content_parts: list[str] = []
+        tc_frags: dict[int, dict[str, Any]] = {}
         try:
-            response = await chat(client, settings.llm_model, messages, tool_schemas)
+            async for delta in chat_stream(client, settings.llm_model, messages, tool_schemas):
+                text_delta = delta["content"]
+                if text_delta:
+                    content_parts.append(text_delta)
+                    yield AgentEvent(type="assistant_delta", content=text_delta)
+                for frag in delta["tool_calls"] or []:
+                    acc = tc_frags.setdefault(
+                        frag["index"],
+                        {"id": "", "type": "function", "function": {"name": "", "arguments": ""}},
+                    )
+                    if frag["id"]:
+                        acc["id"] = frag["id"]
+                    if frag["name"]:
+                        acc["function"]["name"] = frag["name"]
+                    if frag["arguments"]:
+                        acc["function"]["arguments"] += frag["arguments"]
         except Exception as e:
             logger.exception("LLM API error")
+            await _drain_writes()
             yield AgentEvent(type="error", content=f"LLM error: {e}")
             return
 
-        tool_calls: list[dict[str, Any]] | None = response.get("tool_calls")
-        content: str | None = response.get("content")
+        content: str | None = "".join(content_parts) or None
+        tool_calls: list[dict[str, Any]] | None = [tc_frags[i] for i in sorted(tc_frags)] or None
 
         if not tool_calls:
             # Final response
             text = content or ""
-            await execute_query(
-                pool,
-                "INSERT INTO conversations (thread_id, role, content) VALUES ($1, $2, $3)",
-                [thread_id, "assistant", text],
-            )
+            pending_rows.append((thread_id, "assistant", text, None, None))
+            _spawn_flush()
+            await _drain_writes()
             yield AgentEvent(type="assistant", content=text)
             return
 
@@ -259,60 +425,77 @@ async def handle_message(
             assistant_msg["content"] = content
         messages.append(assistant_msg)  # type: ignore[arg-type]
 
-        # Save assistant message with tool calls
-        await execute_query(
-            pool,
-            "INSERT INTO conversations (thread_id, role, content, tool_calls) VALUES ($1, $2, $3, $4::jsonb)",
-            [thread_id, "assistant", content or "", json.dumps(tool_calls)],
-        )
+        # Buffer the assistant message with tool calls
+        # The jsonb codec serializes the tool_calls list directly
+        pending_rows.append((thread_id, "assistant", content or "", None, tool_calls))
 
+        # Parse arguments once and announce every call up front.
+        # calls holds (tc_id, fn_name, fn_args) per tool call.
+        calls: list[tuple[str, str, dict[str, Any]]] = []
         for tc in tool_calls:
             fn_name: str = tc["function"]["name"]
             fn_args_str: str = tc["function"]["arguments"]
-            tc_id: str = tc["id"]
+            fn_args: dict[str, Any] = _loads(fn_args_str)
+            calls.append((tc["id"], fn_name, fn_args))
 
             yield AgentEvent(
                 type="tool_call",
                 content=fn_args_str,
                 name=fn_name,
-                arguments=json.loads(fn_args_str),
+                arguments=fn_args,
             )
 
-            tool_def = tool_map.get(fn_name)
-            if not tool_def:
-                result = json.dumps({"error": f"unknown tool: {fn_name}"})
-            else:
-                try:
-                    fn_args = json.loads(fn_args_str)
-                    result = await tool_def.execute(fn_args, pool)
-                except Exception as e:
-                    logger.exception("Tool execution error: %s", fn_name)
-                    result = json.dumps({"error": str(e)})
-
+        if settings.parallel_tool_calls and len(calls) > 1:
+            # Independent tool calls run concurrently with bounded fan-out;
+            # results are still emitted and persisted in call order so the
+            # conversation context stays deterministic.
+            sem = asyncio.Semaphore(settings.max_parallel_tools)
+
+            async def _run_tool(name: str, args: dict[str, Any]) -> str:
+                async with sem:
+                    return await _execute_tool(tool_map.get(name), name, args, pool)
+
+            async with asyncio.TaskGroup() as tg:
+                tasks = [tg.create_task(_run_tool(name, args)) for _, name, args in calls]
+            results = [t.result() for t in tasks]
+        else:
+            results = [
+                await _execute_tool(tool_map.get(name), name, args, pool)
+                for _, name, args in calls
+            ]
+
+        for (tc_id, fn_name, _), result in zip(calls, results, strict=True):
             yield AgentEvent(type="tool_result", content=result, name=fn_name)
 
             messages.append(
                 {"role": "tool", "content": result, "tool_call_id": tc_id},  # type: ignore[typeddict-unknown-key]
             )
 
-            # Save tool result
-            await execute_query(
-                pool,
-                "INSERT INTO conversations (thread_id, role, content, tool_call_id) VALUES ($1, $2, $3, $4)",
-                [thread_id, "tool", result, tc_id],
-            )
+            # Buffer the tool result
+            pending_rows.append((thread_id, "tool", result, tc_id, None))
 
-            # Handle deferred restart — exit after result is safely persisted
-            try:
-                parsed_result = json.loads(result)
-                if isinstance(parsed_result, dict) and parsed_result.get("_restart"):
-                    sys.exit(42)
-            except (json.JSONDecodeError, TypeError):
-                pass
-
-        # Re-collect tools after each round — write_capability/restart may have
-        # added new capabilities that need to be available on the next iteration.
-        tool_schemas, tool_map = _collect_tools()
+            # Handle deferred restart — exit after result is safely persisted.
+            # Substring sniff first: almost no results contain the marker, so
+            # they skip the full JSON parse (results can be large SQL dumps).
+            if '"_restart"' in result:
+                try:
+                    parsed_result = _loads(result)
+                    if isinstance(parsed_result, dict) and parsed_result.get("_restart"):
+                        _spawn_flush()
+                        await _drain_writes()
+                        sys.exit(42)
+                except (orjson.JSONDecodeError, TypeError):
+                    pass
+
+        # Kick off the round's flush without blocking the next LLM call
+        _spawn_flush()
+
+        # Re-collect tools only after rounds that can change the registry —
+        # write_capability/restart may have added new capabilities that need
+        # to be available on the next iteration.
+        if any(tc["function"]["name"] in ("write_capability", "restart") for tc in tool_calls):
+            tool_schemas, tool_map = _collect_tools()
 
     # Hit max iterations
+    await _drain_writes()
     yield AgentEvent(type="error", content="Max tool iterations reached")
@@ -1,16 +1,33 @@
 from __future__ import annotations
 
+import ast
+import asyncio
+import hashlib
 import importlib
-import json
 import os
 import sys
+import tempfile
 from dataclasses import dataclass
+from itertools import combinations
 from typing import Any
 
 import asyncpg
+import orjson
 from pydantic import BaseModel, Field
 
-from level3.db import execute_query, rows_to_json
+from level3.db import (
+    execute_many,
+    execute_nonquery_count,
+    execute_query,
+    fetch_one,
+    is_read_query,
+    rows_to_json,
+    stream_query_json,
+)
+
+
+def _dumps(obj: Any) -> str:
+    return orjson.dumps(obj).decode()
 
 
 @dataclass
@@ -23,20 +40,26 @@ class ToolDefinition:
 
 # --- execute_sql ---
 
-
-class ExecuteSqlParams(BaseModel):
-    query: str = Field(description="SQL query to execute")
+# Hot-path tools skip Pydantic model construction — the params come from
+# the tool schema the LLM already filled in, so a .get plus a guard is all
+# the validation they need.  write_capability keeps Pydantic since it's
+# rare and benefits from real schema validation.
 
 
 async def execute_sql(
     params: dict[str, Any],
     pool: asyncpg.Pool[asyncpg.Record],
 ) -> str:
-    parsed = ExecuteSqlParams(**params)
-    result = await execute_query(pool, parsed.query)
-    if isinstance(result, list):
-        return rows_to_json(result)
-    return json.dumps({"rows_affected": result})
+    query = params.get("query") or ""
+    if not query:
+        return _dumps({"error": "query is required"})
+    # Arbitrary LLM-written SELECTs can return anything from one row to a
+    # full table dump, so stream them through a cursor instead of
+    # materializing Records + dicts + JSON all at once.
+    if is_read_query(query):
+        return await stream_query_json(pool, query)
+    result = await execute_query(pool, query)
+    return _dumps({"rows_affected": result})
 
 
 EXECUTE_SQL_SCHEMA: dict[str, Any] = {
@@ -74,57 +97,91 @@ class WriteCapabilityParams(BaseModel):
     )
 
 
-async def write_capability(
-    params: dict[str, Any],
-    pool: asyncpg.Pool[asyncpg.Record],
-) -> str:
-    from level3.capability_loader import reload_capabilities
-
-    parsed = WriteCapabilityParams(**params)
+def _install_capability_file(name: str, code: str) -> tuple[str, dict[str, Any] | None]:
+    """Validate, write, and import a capability module.
 
-    # Validate syntax before writing
+    Pure blocking work (parse, file IO, import), so write_capability runs it
+    in a worker thread via asyncio.to_thread.  Returns (file_path, error) —
+    error is None on success, otherwise a dict ready to serialize back to
+    the LLM.
+    """
+    # Validate syntax before writing — ast.parse catches SyntaxError without
+    # paying for bytecode generation (the real compile happens on import)
     try:
-        compile(parsed.code, f"{parsed.name}.py", "exec")
+        ast.parse(code, filename=f"{name}.py")
     except SyntaxError as e:
-        return json.dumps({
+        return "", {
             "error": "syntax_error",
             "message": str(e),
             "line": e.lineno,
             "offset": e.offset,
-        })
+        }
 
-    # Write the file
     import level3.capabilities as cap_pkg
 
     cap_dir = cap_pkg.__path__[0]
-    file_path = f"{cap_dir}/{parsed.name}.py"
+    file_path = f"{cap_dir}/{name}.py"
 
-    with open(file_path, "w") as f:
-        f.write(parsed.code)
+    # Write to a temp file in the same directory and rename into place, so a
+    # crash mid-write can never leave a half-written module for the loader to
+    # import on next startup.  fsync before the rename makes the swap durable.
+    tmp = tempfile.NamedTemporaryFile(
+        mode="w", dir=cap_dir, prefix=f".{name}.", suffix=".tmp", delete=False
+    )
+    try:
+        tmp.write(code)
+        tmp.flush()
+        os.fsync(tmp.fileno())
+        tmp.close()
+        os.replace(tmp.name, file_path)
+    except Exception:
+        tmp.close()
+        try:
+            os.unlink(tmp.name)
+        except FileNotFoundError:
+            pass
+        raise
 
     # Verify it imports correctly
     try:
-        module_name = f"level3.capabilities.{parsed.name}"
+        module_name = f"level3.capabilities.{name}"
         if module_name in sys.modules:
             importlib.reload(sys.modules[module_name])
         else:
             importlib.import_module(module_name)
         # Verify the expected function exists
         mod = sys.modules[module_name]
-        if not hasattr(mod, parsed.name):
+        if not hasattr(mod, name):
             os.remove(file_path)
-            return json.dumps({
+            return file_path, {
                 "error": "missing_function",
-                "message": (
-                    f"Module must define an async function named '{parsed.name}'"
-                ),
-            })
+                "message": f"Module must define an async function named '{name}'",
+            }
     except Exception as e:
         os.remove(file_path)
-        return json.dumps({
+        return file_path, {
             "error": "import_error",
             "message": str(e),
-        })
+        }
+
+    return file_path, None
+
+
+async def write_capability(
+    params: dict[str, Any],
+    pool: asyncpg.Pool[asyncpg.Record],
+) -> str:
+    from level3.capability_loader import reload_capabilities
+
+    parsed = WriteCapabilityParams(**params)
+
+    # Parse, file write, and import are all blocking — run them off the
+    # event loop so other in-flight requests aren't stalled behind them.
+    file_path, error = await asyncio.to_thread(
+        _install_capability_file, parsed.name, parsed.code
+    )
+    if error is not None:
+        return _dumps(error)
 
     # Ensure parameters_schema has "type": "object" — Bedrock rejects schemas without it
     params_schema = parsed.parameters_schema
@@ -141,22 +198,27 @@ async def write_capability(
         },
     }
 
+    # Content hash lets the loader skip re-importing unchanged modules
+    code_hash = hashlib.blake2b(parsed.code.encode(), digest_size=16).hexdigest()
+
     await execute_query(
         pool,
-        "INSERT INTO capabilities (name, description, file_path, tool_schema) "
-        "VALUES ($1, $2, $3, $4::jsonb) "
+        "INSERT INTO capabilities (name, description, file_path, tool_schema, code_hash) "
+        "VALUES ($1, $2, $3, $4::jsonb, $5) "
         "ON CONFLICT (name) DO UPDATE SET "
         "description = EXCLUDED.description, "
         "file_path = EXCLUDED.file_path, "
         "tool_schema = EXCLUDED.tool_schema, "
+        "code_hash = EXCLUDED.code_hash, "
         "updated_at = now()",
-        [parsed.name, parsed.description, file_path, json.dumps(tool_schema)],
+        # The pool's jsonb codec serializes the dict directly
+        [parsed.name, parsed.description, file_path, tool_schema, code_hash],
     )
 
     # Hot-reload
     await reload_capabilities(pool)
 
-    return json.dumps({"status": "ok", "capability": parsed.name, "file": file_path})
+    return _dumps({"status": "ok", "capability": parsed.name, "file": file_path})
 
 
 WRITE_CAPABILITY_SCHEMA: dict[str, Any] = {
@@ -219,110 +281,181 @@ WRITE_CAPABILITY_SCHEMA: dict[str, Any] = {
 # --- manage_tasks ---
 
 
-class ManageTasksParams(BaseModel):
-    action: str = Field(description="One of: create, list, get, update, complete, delete")
-    id: int | None = Field(default=None, description="Task ID")
-    title: str | None = Field(default=None, description="Task title")
-    details: str | None = Field(default=None, description="Task details")
-    status: str | None = Field(default=None, description="New status")
-    due_at: str | None = Field(default=None, description="Due date as ISO 8601 string")
+# Every UPDATE variant is pre-built at import (15 non-empty subsets of the
+# four mutable fields), so the update branch does a dict lookup instead of
+# per-call string assembly — and Postgres sees a fixed set of statement
+# texts it can keep planned.
+_TASK_UPDATE_FIELDS = ("title", "details", "status", "due_at")
+
+
+def _build_task_update_sqls() -> dict[frozenset[str], str]:
+    sqls: dict[frozenset[str], str] = {}
+    for r in range(1, len(_TASK_UPDATE_FIELDS) + 1):
+        for combo in combinations(_TASK_UPDATE_FIELDS, r):
+            sets = ", ".join(
+                f"{field} = ${idx}{'::timestamptz' if field == 'due_at' else ''}"
+                for idx, field in enumerate(combo, start=1)
+            )
+            sqls[frozenset(combo)] = (
+                f"UPDATE tasks SET {sets}, updated_at = now() "
+                f"WHERE id = ${len(combo) + 1} "
+                "RETURNING id, title, status, due_at"
+            )
+    return sqls
+
+
+_TASK_UPDATE_SQLS = _build_task_update_sqls()
+
+
+@dataclass(slots=True)
+class ManageTasksParams:
+    action: str
+    id: int | None = None
+    title: str | None = None
+    details: str | None = None
+    status: str | None = None
+    due_at: str | None = None
+    items: list[dict[str, Any]] | None = None
+
+
+def _parse_manage_tasks(params: dict[str, Any]) -> ManageTasksParams:
+    raw_id = params.get("id")
+    return ManageTasksParams(
+        action=str(params.get("action") or ""),
+        id=int(raw_id) if raw_id is not None else None,
+        title=params.get("title"),
+        details=params.get("details"),
+        status=params.get("status"),
+        due_at=params.get("due_at"),
+        items=params.get("items"),
+    )
 
 
-async def manage_tasks(
-    params: dict[str, Any],
-    pool: asyncpg.Pool[asyncpg.Record],
+async def _task_create(
+    parsed: ManageTasksParams, pool: asyncpg.Pool[asyncpg.Record]
 ) -> str:
-    parsed = ManageTasksParams(**params)
-
-    if parsed.action == "create":
-        if not parsed.title:
-            return json.dumps({"error": "title is required for create"})
-        result = await execute_query(
+    # Bulk create — one prepared statement, all rows in a single batch
+    if parsed.items:
+        rows = [
+            (item.get("title"), item.get("details") or "", item.get("due_at"))
+            for item in parsed.items
+        ]
+        if any(not row[0] for row in rows):
+            return _dumps({"error": "every item needs a title"})
+        count = await execute_many(
             pool,
-            "INSERT INTO tasks (title, details, due_at) "
-            "VALUES ($1, $2, $3::timestamptz) "
-            "RETURNING id, title, status, due_at, created_at",
-            [parsed.title, parsed.details or "", parsed.due_at],
+            "INSERT INTO tasks (title, details, due_at) VALUES ($1, $2, $3::timestamptz)",
+            rows,
         )
-        return rows_to_json(result) if isinstance(result, list) else json.dumps({"id": result})
+        return _dumps({"created": count})
 
-    elif parsed.action == "list":
-        rows = await execute_query(
-            pool,
-            "SELECT id, title, status, due_at, created_at FROM tasks "
-            "WHERE status NOT IN ('done', 'cancelled') "
-            "ORDER BY due_at NULLS LAST, id",
-        )
-        return rows_to_json(rows) if isinstance(rows, list) else "[]"
+    if not parsed.title:
+        return _dumps({"error": "title is required for create"})
+    result = await execute_query(
+        pool,
+        "INSERT INTO tasks (title, details, due_at) "
+        "VALUES ($1, $2, $3::timestamptz) "
+        "RETURNING id, title, status, due_at, created_at",
+        [parsed.title, parsed.details or "", parsed.due_at],
+    )
+    return rows_to_json(result) if isinstance(result, list) else _dumps({"id": result})
 
-    elif parsed.action == "get":
-        if parsed.id is None:
-            return json.dumps({"error": "id is required for get"})
-        rows = await execute_query(
-            pool,
-            "SELECT * FROM tasks WHERE id = $1",
-            [parsed.id],
-        )
-        return rows_to_json(rows) if isinstance(rows, list) else "[]"
-
-    elif parsed.action == "update":
-        if parsed.id is None:
-            return json.dumps({"error": "id is required for update"})
-        sets: list[str] = []
-        params: list[Any] = []
-        idx = 1
-        if parsed.title is not None:
-            sets.append(f"title = ${idx}")
-            params.append(parsed.title)
-            idx += 1
-        if parsed.details is not None:
-            sets.append(f"details = ${idx}")
-            params.append(parsed.details)
-            idx += 1
-        if parsed.status is not None:
-            sets.append(f"status = ${idx}")
-            params.append(parsed.status)
-            idx += 1
-        if parsed.due_at is not None:
-            sets.append(f"due_at = ${idx}::timestamptz")
-            params.append(parsed.due_at)
-            idx += 1
-        if not sets:
-            return json.dumps({"error": "nothing to update"})
-        sets.append("updated_at = now()")
-        params.append(parsed.id)
-        result = await execute_query(
-            pool,
-            f"UPDATE tasks SET {', '.join(sets)} WHERE id = ${idx} "
-            "RETURNING id, title, status, due_at",
-            params,
-        )
-        return rows_to_json(result) if isinstance(result, list) else json.dumps({"updated": 0})
 
-    elif parsed.action == "complete":
-        if parsed.id is None:
-            return json.dumps({"error": "id is required for complete"})
-        result = await execute_query(
-            pool,
-            "UPDATE tasks SET status = 'done', updated_at = now() "
-            "WHERE id = $1 RETURNING id, title, status",
-            [parsed.id],
-        )
-        return rows_to_json(result) if isinstance(result, list) else json.dumps({"updated": 0})
+async def _task_list(
+    parsed: ManageTasksParams, pool: asyncpg.Pool[asyncpg.Record]
+) -> str:
+    rows = await execute_query(
+        pool,
+        "SELECT id, title, status, due_at, created_at FROM tasks "
+        "WHERE status NOT IN ('done', 'cancelled') "
+        "ORDER BY due_at NULLS LAST, id",
+    )
+    return rows_to_json(rows) if isinstance(rows, list) else "[]"
 
-    elif parsed.action == "delete":
-        if parsed.id is None:
-            return json.dumps({"error": "id is required for delete"})
-        result = await execute_query(
-            pool,
-            "DELETE FROM tasks WHERE id = $1",
-            [parsed.id],
-        )
-        count = result if isinstance(result, int) else 0
-        return json.dumps({"deleted": count})
 
-    else:
-        return json.dumps({"error": f"unknown action: {parsed.action}"})
+async def _task_get(
+    parsed: ManageTasksParams, pool: asyncpg.Pool[asyncpg.Record]
+) -> str:
+    if parsed.id is None:
+        return _dumps({"error": "id is required for get"})
+    row = await fetch_one(
+        pool,
+        "SELECT * FROM tasks WHERE id = $1",
+        [parsed.id],
+    )
+    return rows_to_json([row]) if row is not None else "[]"
+
+
+async def _task_update(
+    parsed: ManageTasksParams, pool: asyncpg.Pool[asyncpg.Record]
+) -> str:
+    if parsed.id is None:
+        return _dumps({"error": "id is required for update"})
+    # Fields bind in declaration order, matching how the SQL was built
+    fields = [
+        (name, getattr(parsed, name))
+        for name in _TASK_UPDATE_FIELDS
+        if getattr(parsed, name) is not None
+    ]
+    if not fields:
+        return _dumps({"error": "nothing to update"})
+    sql = _TASK_UPDATE_SQLS[frozenset(name for name, _ in fields)]
+    args: list[Any] = [value for _, value in fields]
+    args.append(parsed.id)
+    # fetch_one: the statement RETURNs the updated row, which execute_query's
+    # mutation path would discard in favor of the status tag
+    row = await fetch_one(pool, sql, args)
+    return rows_to_json([row]) if row is not None else _dumps({"updated": 0})
+
+
+async def _task_complete(
+    parsed: ManageTasksParams, pool: asyncpg.Pool[asyncpg.Record]
+) -> str:
+    if parsed.id is None:
+        return _dumps({"error": "id is required for complete"})
+    row = await fetch_one(
+        pool,
+        "UPDATE tasks SET status = 'done', updated_at = now() "
+        "WHERE id = $1 RETURNING id, title, status",
+        [parsed.id],
+    )
+    return rows_to_json([row]) if row is not None else _dumps({"updated": 0})
+
+
+async def _task_delete(
+    parsed: ManageTasksParams, pool: asyncpg.Pool[asyncpg.Record]
+) -> str:
+    if parsed.id is None:
+        return _dumps({"error": "id is required for delete"})
+    count = await execute_nonquery_count(
+        pool,
+        "DELETE FROM tasks WHERE id = $1",
+        [parsed.id],
+    )
+    return _dumps({"deleted": count})
+
+
+# Constant-time action dispatch; each handler is also independently
+# optimizable without growing one monolithic function.
+_TASK_ACTIONS = {
+    "create": _task_create,
+    "list": _task_list,
+    "get": _task_get,
+    "update": _task_update,
+    "complete": _task_complete,
+    "delete": _task_delete,
+}
+
+
+async def manage_tasks(
+    params: dict[str, Any],
+    pool: asyncpg.Pool[asyncpg.Record],
+) -> str:
+    parsed = _parse_manage_tasks(params)
+    handler = _TASK_ACTIONS.get(parsed.action)
+    if handler is None:
+        return _dumps({"error": f"unknown action: {parsed.action}"})
+    return await handler(parsed, pool)
 
 
 MANAGE_TASKS_SCHEMA: dict[str, Any] = {
@@ -352,6 +485,14 @@ MANAGE_TASKS_SCHEMA: dict[str, Any] = {
                     "type": "string",
                     "description": "Due date as ISO 8601 string",
                 },
+                "items": {
+                    "type": "array",
+                    "description": (
+                        "For bulk create: list of {title, details, due_at} objects, "
+                        "inserted in one batch"
+                    ),
+                    "items": {"type": "object"},
+                },
             },
             "required": ["action"],
         },
@@ -362,27 +503,20 @@ MANAGE_TASKS_SCHEMA: dict[str, Any] = {
 # --- restart ---
 
 
-class RestartParams(BaseModel):
-    mode: str = Field(
-        default="reload",
-        description="'reload' to hot-reload capabilities, 'full' to restart the process",
-    )
-
-
 async def restart(
     params: dict[str, Any],
     pool: asyncpg.Pool[asyncpg.Record],
 ) -> str:
-    parsed = RestartParams(**params)
-    if parsed.mode == "full":
-        return json.dumps({"status": "restarting", "_restart": True})
-    elif parsed.mode == "reload":
+    mode = params.get("mode") or "reload"
+    if mode == "full":
+        return _dumps({"status": "restarting", "_restart": True})
+    elif mode == "reload":
         from level3.capability_loader import reload_capabilities
 
         await reload_capabilities(pool)
-        return json.dumps({"status": "reloaded"})
+        return _dumps({"status": "reloaded"})
     else:
-        return json.dumps({"error": f"unknown mode: {parsed.mode}"})
+        return _dumps({"error": f"unknown mode: {mode}"})
 
 
 RESTART_SCHEMA: dict[str, Any] = {
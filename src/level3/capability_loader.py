@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import importlib
 import json
 import logging
@@ -13,52 +14,104 @@ from level3.bootstrap_tools import ToolDefinition
 logger = logging.getLogger(__name__)
 
 _loaded_capabilities: dict[str, ToolDefinition] = {}
+# code_hash of each imported module — reloads skip modules whose source is
+# unchanged since the last import.
+_loaded_hashes: dict[str, str] = {}
+_capabilities_version: int = 0
+_NO_CAPABILITIES_SECTION = "You have no self-built capabilities yet."
+_capabilities_section: str = _NO_CAPABILITIES_SECTION
+
+
+def _decode_schema(raw_schema: Any) -> dict[str, Any]:
+    if isinstance(raw_schema, str):
+        return json.loads(raw_schema)  # type: ignore[no-any-return]
+    if isinstance(raw_schema, dict):
+        return raw_schema
+    return {}
+
+
+def _import_one(row: asyncpg.Record) -> ToolDefinition:
+    """Import (or reload) one capability module. Runs in a worker thread.
+
+    Safe to fan out: the import machinery takes a per-module lock, and each
+    capability lives in its own module.
+    """
+    name: str = row["name"]
+    module_name = f"level3.capabilities.{name}"
+    if module_name in sys.modules:
+        module = importlib.reload(sys.modules[module_name])
+    else:
+        module = importlib.import_module(module_name)
+
+    fn = getattr(module, name)
+    return ToolDefinition(
+        name=name,
+        description=row["description"],
+        schema=_decode_schema(row["tool_schema"]),
+        execute=fn,
+    )
 
 
 async def load_capabilities(
     pool: asyncpg.Pool[asyncpg.Record],
 ) -> dict[str, ToolDefinition]:
     """Load all capabilities from the database and import their modules."""
-    global _loaded_capabilities  # noqa: PLW0603
+    global _loaded_capabilities, _capabilities_version, _capabilities_section  # noqa: PLW0603
 
     async with pool.acquire() as conn:
         rows = await conn.fetch(
-            "SELECT name, description, file_path, tool_schema FROM capabilities"
+            "SELECT name, description, file_path, tool_schema, code_hash FROM capabilities"
         )
 
     capabilities: dict[str, ToolDefinition] = {}
+    to_import: list[asyncpg.Record] = []
 
     for row in rows:
         name: str = row["name"]
-        try:
-            module_name = f"level3.capabilities.{name}"
-            if module_name in sys.modules:
-                module = importlib.reload(sys.modules[module_name])
-            else:
-                module = importlib.import_module(module_name)
-
-            fn = getattr(module, name)
-            raw_schema = row["tool_schema"]
-            if isinstance(raw_schema, str):
-                schema: dict[str, Any] = json.loads(raw_schema)
-            elif isinstance(raw_schema, dict):
-                schema = raw_schema
-            else:
-                schema = {}
+        code_hash: str | None = row["code_hash"]
 
+        # Source unchanged since last import — reuse the loaded function
+        # and just refresh the metadata from the row.
+        prev = _loaded_capabilities.get(name)
+        if prev is not None and code_hash and _loaded_hashes.get(name) == code_hash:
             capabilities[name] = ToolDefinition(
                 name=name,
                 description=row["description"],
-                schema=schema,
-                execute=fn,
+                schema=_decode_schema(row["tool_schema"]),
+                execute=prev.execute,
             )
+        else:
+            to_import.append(row)
+
+    # Imports block on disk reads and bytecode compilation; fan them out to
+    # worker threads instead of serializing them on the event loop.
+    if to_import:
+        results = await asyncio.gather(
+            *(asyncio.to_thread(_import_one, row) for row in to_import),
+            return_exceptions=True,
+        )
+        for row, result in zip(to_import, results, strict=True):
+            name = row["name"]
+            if isinstance(result, BaseException):
+                logger.error("Failed to load capability: %s", name, exc_info=result)
+                continue
+            capabilities[name] = result
+            if row["code_hash"]:
+                _loaded_hashes[name] = row["code_hash"]
             logger.info("Loaded capability: %s", name)
 
-        except Exception:
-            logger.exception("Failed to load capability: %s", name)
-            continue
-
     _loaded_capabilities = capabilities
+    _capabilities_version += 1
+
+    # Render the prompt section once per (re)load instead of per turn; the
+    # cached string also stays byte-identical across turns, which keeps the
+    # system-prompt prefix stable for provider-side caching.
+    if capabilities:
+        lines = "\n".join(f"- {name}: {td.description}" for name, td in capabilities.items())
+        _capabilities_section = f"You have {len(capabilities)} self-built capabilities:\n{lines}"
+    else:
+        _capabilities_section = _NO_CAPABILITIES_SECTION
+
     return capabilities
 
 
@@ -72,3 +125,17 @@ async def reload_capabilities(
 def get_loaded_capabilities() -> dict[str, ToolDefinition]:
     """Return currently loaded capabilities without hitting the DB."""
     return _loaded_capabilities
+
+
+def get_capabilities_section() -> str:
+    """Return the cached system-prompt section describing loaded capabilities."""
+    return _capabilities_section
+
+
+def get_capabilities_version() -> int:
+    """Return a counter that increments on every (re)load of capabilities.
+
+    Lets callers cheaply detect whether the registry changed since they
+    last assembled derived state (e.g. tool schema lists).
+    """
+    return _capabilities_version
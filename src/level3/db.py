@@ -1,16 +1,81 @@
 from __future__ import annotations
 
-import json
+from collections.abc import Sequence
 from pathlib import Path
 from typing import Any
 
 import asyncpg
+import orjson
 
 SCHEMA_PATH = Path(__file__).resolve().parent.parent.parent / "schema.sql"
 
 
-async def create_pool(database_url: str) -> asyncpg.Pool[asyncpg.Record]:
-    pool: asyncpg.Pool[asyncpg.Record] = await asyncpg.create_pool(dsn=database_url)
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    """Register an orjson JSONB codec on each new pooled connection.
+
+    JSONB columns then arrive pre-decoded as Python structures and can be
+    bound directly as dicts/lists, removing a json.loads per row read and a
+    json.dumps per write.  Binary format skips the text round-trip; the
+    leading byte is the JSONB version tag.
+    """
+    await conn.set_type_codec(
+        "jsonb",
+        encoder=lambda obj: b"\x01" + orjson.dumps(obj),
+        decoder=lambda data: orjson.loads(data[1:]),
+        schema="pg_catalog",
+        format="binary",
+    )
+
+
+async def create_pool(
+    database_url: str,
+    min_size: int = 4,
+    max_size: int = 25,
+    statement_cache_size: int = 256,
+    max_cached_statement_lifetime: float = 300.0,
+    max_inactive_connection_lifetime: float = 300.0,
+    prewarm: Sequence[tuple[str, tuple[Any, ...]]] = (),
+) -> asyncpg.Pool[asyncpg.Record]:
+    # asyncpg keys a per-connection prepared-statement LRU on exact query
+    # text, so parameterized queries issued from module-level SQL constants
+    # are parsed/planned once per connection and reused after that.  Size it
+    # above the default 100 so hot statements never get evicted by ad-hoc
+    # execute_sql traffic.
+    #
+    # asyncpg opens min_size connections eagerly inside create_pool, so the
+    # floor is pre-warmed (TCP + auth + codec setup) before the first
+    # request — no manual acquire/release priming loop needed.
+    #
+    # max_cached_statement_lifetime bounds how long any cached statement
+    # lives (asyncpg's default, made explicit here): Postgres flips a
+    # prepared statement to a generic plan after a few executions, and on
+    # skewed parameter distributions that plan can be pathologically worse
+    # than a fresh one — aging the cache re-plans periodically so a bad
+    # generic plan can't stick for the life of the connection.
+    async def _init(conn: asyncpg.Connection[asyncpg.Record]) -> None:
+        await _init_connection(conn)
+        # Prime the statement cache with hot read statements (paired with
+        # harmless dummy arguments) so each new connection — including
+        # replacements opened later — parses and plans them before serving
+        # its first real request.  conn.prepare() can't do this: it bypasses
+        # the LRU cache that fetch/execute consult.
+        for sql, args in prewarm:
+            try:
+                await conn.fetch(sql, *args)
+            except asyncpg.PostgresError:
+                # Best-effort: on a fresh install the first connections open
+                # before run_schema has created the tables
+                break
+
+    pool: asyncpg.Pool[asyncpg.Record] = await asyncpg.create_pool(
+        dsn=database_url,
+        min_size=min_size,
+        max_size=max_size,
+        statement_cache_size=statement_cache_size,
+        max_cached_statement_lifetime=max_cached_statement_lifetime,
+        max_inactive_connection_lifetime=max_inactive_connection_lifetime,
+        init=_init,
+    )
     return pool
 
 
@@ -20,35 +85,183 @@ async def run_schema(pool: asyncpg.Pool[asyncpg.Record]) -> None:
         await conn.execute(schema)
 
 
+# Most callers hand over the pool; passing an already-acquired connection
+# lets multi-statement flows skip the per-query acquire/release cycle.
+PoolOrConn = asyncpg.Pool[asyncpg.Record] | asyncpg.Connection[asyncpg.Record]
+
+
 async def execute_query(
-    pool: asyncpg.Pool[asyncpg.Record],
+    pool_or_conn: PoolOrConn,
     query: str,
     params: list[Any] | None = None,
 ) -> list[dict[str, Any]] | int:
     """Execute a SQL query. Returns list of dicts for SELECT, row count string for mutations.
 
     Use $1, $2, etc. for parameter placeholders and pass values via params list.
+    Accepts either a pool (acquires per call) or an already-acquired
+    connection (reused directly — cheaper when a tool issues several
+    statements back to back).
+
+    Prepared-statement reuse is handled by asyncpg: conn.fetch/execute
+    auto-prepare and cache per connection keyed on exact query text (cache
+    sized in create_pool), so repeated fixed-text queries skip parse/plan
+    without any manual PreparedStatement bookkeeping here.
     """
     args = params or []
-    async with pool.acquire() as conn:
-        stmt = query.strip().upper()
-        if stmt.startswith("SELECT") or stmt.startswith("WITH"):
-            rows = await conn.fetch(query, *args)
-            return [dict(row) for row in rows]
-        else:
+    if isinstance(pool_or_conn, asyncpg.Pool):
+        async with pool_or_conn.acquire() as conn:
+            return await _run_query(conn, query, args)
+    return await _run_query(pool_or_conn, query, args)
+
+
+def is_read_query(query: str) -> bool:
+    """True if the query's first token is SELECT/WITH (row-returning).
+
+    Probes only the first token — upper-casing the whole query would
+    allocate a full copy of potentially multi-KB SQL just to test a prefix.
+    """
+    head = query.lstrip(" \t\r\n(")[:6].lower()
+    return head.startswith(("select", "with"))
+
+
+async def _run_query(
+    conn: asyncpg.Connection[asyncpg.Record],
+    query: str,
+    args: list[Any],
+) -> list[dict[str, Any]] | int:
+    if is_read_query(query):
+        rows = await conn.fetch(query, *args)
+        if not rows:
+            return []
+        # All rows share one shape — grab the keys once and zip values
+        # (iterating a Record yields values in C) instead of routing every
+        # row through dict(row)'s mapping-protocol lookups.
+        keys = tuple(rows[0].keys())
+        return [dict(zip(keys, row, strict=True)) for row in rows]
+    else:
+        result = await conn.execute(query, *args)
+        return _status_tag_count(result)
+
+
+def _status_tag_count(tag: str) -> int:
+    """Extract the row count from an asyncpg status tag like "INSERT 0 1".
+
+    Slices from the last space instead of split() — no list allocation per
+    mutation.
+    """
+    i = tag.rfind(" ")
+    if i < 0:
+        return 0
+    try:
+        return int(tag[i + 1 :])
+    except ValueError:
+        return 0
+
+
+async def execute_nonquery_count(
+    pool_or_conn: PoolOrConn,
+    query: str,
+    params: list[Any] | None = None,
+) -> int:
+    """Run a mutation and return its affected-row count.
+
+    For callers that already know the statement doesn't return rows —
+    skips execute_query's read/write sniffing entirely.
+    """
+    args = params or []
+    if isinstance(pool_or_conn, asyncpg.Pool):
+        async with pool_or_conn.acquire() as conn:
             result = await conn.execute(query, *args)
-            # asyncpg returns e.g. "INSERT 0 1" — extract the count
-            parts = result.split()
-            try:
-                return int(parts[-1])
-            except (ValueError, IndexError):
-                return 0
+    else:
+        result = await pool_or_conn.execute(query, *args)
+    return _status_tag_count(result)
 
 
-def rows_to_json(rows: list[dict[str, Any]]) -> str:
-    """Serialize query result rows to JSON, handling non-serializable types."""
+async def fetch_one(
+    pool_or_conn: PoolOrConn,
+    query: str,
+    params: list[Any] | None = None,
+) -> dict[str, Any] | None:
+    """Fetch at most one row as a dict, or None if the query matched nothing.
+
+    Skips the list-building read path in execute_query — fetchrow returns a
+    single Record without materializing a result list.
+    """
+    args = params or []
+    if isinstance(pool_or_conn, asyncpg.Pool):
+        async with pool_or_conn.acquire() as conn:
+            row = await conn.fetchrow(query, *args)
+    else:
+        row = await pool_or_conn.fetchrow(query, *args)
+    return dict(row) if row is not None else None
+
+
+async def execute_many(
+    pool_or_conn: PoolOrConn,
+    query: str,
+    args_rows: list[tuple[Any, ...]],
+) -> int:
+    """Execute one statement for many parameter tuples in a single batch.
+
+    asyncpg prepares the statement once and pipelines all bindings over one
+    round-trip, so this is the cheap way to persist N rows at once.  Returns
+    the number of parameter tuples executed.
+    """
+    if not args_rows:
+        return 0
+    if isinstance(pool_or_conn, asyncpg.Pool):
+        async with pool_or_conn.acquire() as conn:
+            await conn.executemany(query, args_rows)
+    else:
+        await pool_or_conn.executemany(query, args_rows)
+    return len(args_rows)
 
-    def _default(obj: object) -> str:
-        return str(obj)
 
-    return json.dumps(rows, default=_default)
+async def stream_query_json(
+    pool_or_conn: PoolOrConn,
+    query: str,
+    params: list[Any] | None = None,
+    prefetch: int = 500,
+) -> str:
+    """Run a SELECT through a server-side cursor and serialize incrementally.
+
+    Rows are encoded into the output buffer in prefetch-sized batches as
+    they arrive, so peak memory is one batch instead of the full Record
+    list + dict list + JSON string that execute_query materializes.
+    """
+    args = params or []
+    buf = bytearray(b"[")
+    if isinstance(pool_or_conn, asyncpg.Pool):
+        async with pool_or_conn.acquire() as conn:
+            await _stream_into(conn, query, args, prefetch, buf)
+    else:
+        await _stream_into(pool_or_conn, query, args, prefetch, buf)
+    buf += b"]"
+    return buf.decode()
+
+
+async def _stream_into(
+    conn: asyncpg.Connection[asyncpg.Record],
+    query: str,
+    args: list[Any],
+    prefetch: int,
+    buf: bytearray,
+) -> None:
+    # Cursors only exist inside a transaction
+    async with conn.transaction():
+        keys: tuple[str, ...] | None = None
+        async for record in conn.cursor(query, *args, prefetch=prefetch):
+            if keys is None:
+                keys = tuple(record.keys())
+            else:
+                buf += b","
+            buf += orjson.dumps(dict(zip(keys, record, strict=True)), default=str)
+
+
+def rows_to_json(rows: list[dict[str, Any]]) -> str:
+    """Serialize query result rows to JSON, handling non-serializable types.
+
+    orjson handles datetime/date/UUID natively in C; anything else
+    (Decimal, IP addresses, ranges) falls back to str().
+    """
+    return orjson.dumps(rows, default=str).decode()
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from collections.abc import AsyncGenerator
 from typing import Any
 
 from openai import AsyncOpenAI
@@ -11,11 +12,20 @@ from openai.types.chat import (
 from level3.config import Settings
 
 
+# One client per (base_url, api_key) for the process lifetime.  Each
+# AsyncOpenAI construction builds an httpx.AsyncClient with its own TLS
+# context and connection pool; reusing the instance keeps connections warm
+# across calls instead of re-handshaking.
+_clients: dict[tuple[str, str], AsyncOpenAI] = {}
+
+
 def create_client(settings: Settings) -> AsyncOpenAI:
-    return AsyncOpenAI(
-        base_url=settings.get_base_url(),
-        api_key=settings.get_api_key(),
-    )
+    key = (settings.base_url, settings.api_key)
+    client = _clients.get(key)
+    if client is None:
+        client = AsyncOpenAI(base_url=key[0], api_key=key[1])
+        _clients[key] = client
+    return client
 
 
 async def chat(
@@ -28,7 +38,10 @@ async def chat(
 
     Returns a dict with keys:
         - content: str | None (the assistant's text response)
-        - tool_calls: list[dict] | None (any tool calls requested)
+        - tool_calls: the SDK's tool-call objects, or None.  Each exposes
+          .id, .function.name, and .function.arguments; they are passed
+          through as-is rather than re-boxed into dicts, since callers
+          read attributes (or serialize) immediately anyway.
     """
     kwargs: dict[str, Any] = {
         "model": model,
@@ -40,21 +53,56 @@ async def chat(
     response = await client.chat.completions.create(**kwargs)
     message = response.choices[0].message
 
-    tool_calls: list[dict[str, Any]] | None = None
-    if message.tool_calls:
-        tool_calls = [
-            {
-                "id": tc.id,
-                "type": "function",
-                "function": {
-                    "name": tc.function.name,
-                    "arguments": tc.function.arguments,
-                },
-            }
-            for tc in message.tool_calls
-        ]
-
     return {
         "content": message.content,
-        "tool_calls": tool_calls,
+        "tool_calls": message.tool_calls or None,
+    }
+
+
+async def chat_stream(
+    client: AsyncOpenAI,
+    model: str,
+    messages: list[ChatCompletionMessageParam],
+    tools: list[ChatCompletionToolParam] | None = None,
+) -> AsyncGenerator[dict[str, Any]]:
+    """Stream a chat completion, yielding one delta dict per chunk.
+
+    Each yielded dict has keys:
+        - content: str | None (text delta, if any)
+        - tool_calls: list[dict] | None (tool-call fragments with keys
+          index, id, name, arguments — id/name arrive on the first fragment,
+          arguments accumulate across fragments)
+        - finish_reason: str | None (set on the final chunk of the choice)
+    """
+    kwargs: dict[str, Any] = {
+        "model": model,
+        "messages": messages,
+        "stream": True,
     }
+    if tools:
+        kwargs["tools"] = tools
+
+    stream = await client.chat.completions.create(**kwargs)
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        delta = choice.delta
+
+        tool_calls: list[dict[str, Any]] | None = None
+        if delta.tool_calls:
+            tool_calls = [
+                {
+                    "index": tc.index,
+                    "id": tc.id,
+                    "name": tc.function.name if tc.function else None,
+                    "arguments": tc.function.arguments if tc.function else None,
+                }
+                for tc in delta.tool_calls
+            ]
+
+        yield {
+            "content": delta.content,
+            "tool_calls": tool_calls,
+            "finish_reason": choice.finish_reason,
+        }
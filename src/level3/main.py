@@ -1,13 +1,15 @@
 from __future__ import annotations
 
-import json
+import asyncio
 import logging
+from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 from typing import Any
 
 import asyncpg
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse
+import orjson
+from fastapi import FastAPI, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 
 from level3.agent import AgentEvent, handle_message
@@ -30,11 +32,49 @@ class AppState:
 state = AppState()
 
 
+# Hot read statements as module constants: asyncpg's statement cache keys on
+# exact query text, and fixed constants let the pool pre-parse them on every
+# new connection (see prewarm below).
+_SQL_LIST_THREADS = (
+    "SELECT t.id, t.title, t.created_at, t.updated_at, c.content AS first_message "
+    "FROM conversation_threads t "
+    "LEFT JOIN LATERAL ("
+    "  SELECT content FROM conversations "
+    "  WHERE thread_id = t.id AND role = 'user' ORDER BY id LIMIT 1"
+    ") c ON true "
+    "ORDER BY t.updated_at DESC "
+    "LIMIT 100"
+)
+_SQL_HISTORY = (
+    "SELECT role, content, tool_call_id, tool_calls, created_at "
+    "FROM conversations WHERE thread_id = $1 ORDER BY id DESC LIMIT 200"
+)
+_SQL_MAX_CONV_ID = "SELECT MAX(id) FROM conversations WHERE thread_id = $1"
+_SQL_HAS_USER_MSG = (
+    "SELECT EXISTS(SELECT 1 FROM conversations WHERE thread_id = $1 AND role = 'user')"
+)
+
+# (statement, dummy args) pairs executed once per new pool connection so the
+# first real request on it skips parse/plan.  Reads only — mutations prime
+# themselves on first use.
+_PREWARM_QUERIES: list[tuple[str, tuple[Any, ...]]] = [
+    (_SQL_LIST_THREADS, ()),
+    (_SQL_HISTORY, (-1,)),
+    (_SQL_MAX_CONV_ID, (-1,)),
+    (_SQL_HAS_USER_MSG, (-1,)),
+]
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):  # noqa: ANN201, ARG001
     # Startup
     logger.info("Starting Level 3...")
-    state.pool = await create_pool(settings.database_url)
+    state.pool = await create_pool(
+        settings.database_url,
+        min_size=settings.db_pool_min,
+        max_size=settings.db_pool_max,
+        prewarm=_PREWARM_QUERIES,
+    )
     await run_schema(state.pool)
     # Run migration for existing installs
     await _migrate(state.pool)
@@ -46,175 +86,239 @@ async def lifespan(app: FastAPI):  # noqa: ANN201, ARG001
     await state.pool.close()
 
 
+# Arbitrary but stable app-wide advisory-lock key for startup migrations
+_MIGRATION_LOCK_ID = 0x4C33
+
+
 async def _migrate(pool: asyncpg.Pool[asyncpg.Record]) -> None:
     """Run migrations for conversation_threads support."""
     async with pool.acquire() as conn:
-        # Create threads table if missing
+        # Serialize against other workers booting at the same time
+        await conn.execute("SELECT pg_advisory_lock($1)", _MIGRATION_LOCK_ID)
+        try:
+            await _migrate_locked(conn)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", _MIGRATION_LOCK_ID)
+
+
+async def _migrate_locked(conn: asyncpg.Connection[asyncpg.Record]) -> None:
+    # One probe for all migration state.  pg_catalog lookups are much cheaper
+    # than the information_schema views (which join several catalogs), and
+    # conditional DDL beats running ALTER/CREATE IF NOT EXISTS every boot.
+    flags = await conn.fetchrow(
+        "SELECT "
+        "EXISTS(SELECT 1 FROM pg_attribute a JOIN pg_class c ON a.attrelid = c.oid "
+        "  WHERE c.relname = 'capabilities' AND a.attname = 'code_hash' "
+        "  AND NOT a.attisdropped) AS has_code_hash, "
+        "EXISTS(SELECT 1 FROM pg_class WHERE relname = 'conversation_threads') AS has_threads, "
+        "EXISTS(SELECT 1 FROM pg_attribute a JOIN pg_class c ON a.attrelid = c.oid "
+        "  WHERE c.relname = 'conversations' AND a.attname = 'thread_id' "
+        "  AND NOT a.attisdropped) AS has_thread_id"
+    )
+
+    if not flags["has_code_hash"]:
+        # code_hash column for skipping re-imports of unchanged capabilities
+        await conn.execute("ALTER TABLE capabilities ADD COLUMN code_hash TEXT")
+
+    if not flags["has_threads"]:
         await conn.execute("""
-            CREATE TABLE IF NOT EXISTS conversation_threads (
+            CREATE TABLE conversation_threads (
                 id SERIAL PRIMARY KEY,
                 title TEXT NOT NULL DEFAULT 'New conversation',
                 created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
                 updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
             )
         """)
-        # Add thread_id column if missing
-        col = await conn.fetchval("""
-            SELECT 1 FROM information_schema.columns
-            WHERE table_name = 'conversations' AND column_name = 'thread_id'
+
+    if not flags["has_thread_id"]:
+        await conn.execute("""
+            ALTER TABLE conversations ADD COLUMN thread_id INTEGER REFERENCES conversation_threads(id)
+        """)
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_conversations_thread_id ON conversations(thread_id)
         """)
-        if not col:
-            await conn.execute("""
-                ALTER TABLE conversations ADD COLUMN thread_id INTEGER REFERENCES conversation_threads(id)
-            """)
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_conversations_thread_id ON conversations(thread_id)
+        # Migrate existing messages into a default thread.  Backfill in
+        # bounded batches so each transaction touches at most 10k rows —
+        # one giant UPDATE over a large history would hold locks and WAL
+        # for the whole table and hang startup.
+        has_orphans = await conn.fetchval(
+            "SELECT EXISTS(SELECT 1 FROM conversations WHERE thread_id IS NULL)"
+        )
+        if has_orphans:
+            tid = await conn.fetchval("""
+                INSERT INTO conversation_threads (title) VALUES ('Initial conversation') RETURNING id
             """)
-            # Migrate existing messages into a default thread
-            existing = await conn.fetchval("SELECT COUNT(*) FROM conversations WHERE thread_id IS NULL")
-            if existing and existing > 0:
-                tid = await conn.fetchval("""
-                    INSERT INTO conversation_threads (title) VALUES ('Initial conversation') RETURNING id
-                """)
-                await conn.execute("UPDATE conversations SET thread_id = $1 WHERE thread_id IS NULL", tid)
+            while True:
+                ids = [
+                    r["id"]
+                    for r in await conn.fetch(
+                        "SELECT id FROM conversations WHERE thread_id IS NULL LIMIT 10000"
+                    )
+                ]
+                if not ids:
+                    break
+                async with conn.transaction():
+                    await conn.execute(
+                        "UPDATE conversations SET thread_id = $1 WHERE id = ANY($2::int4[])",
+                        tid, ids,
+                    )
 
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 
 # ── Thread management APIs ──
 
 @app.get("/api/threads")
-async def list_threads() -> JSONResponse:
-    rows = await state.pool.fetch(
-        "SELECT t.id, t.title, t.created_at, t.updated_at, "
-        "  (SELECT content FROM conversations WHERE thread_id = t.id AND role = 'user' ORDER BY id LIMIT 1) AS first_message "
-        "FROM conversation_threads t "
-        "ORDER BY t.updated_at DESC "
-        "LIMIT 100"
-    )
-    threads = []
-    for row in rows:
-        threads.append({
-            "id": row["id"],
-            "title": row["title"],
-            "first_message": row["first_message"],
-            "created_at": row["created_at"].isoformat() if row["created_at"] else None,
-            "updated_at": row["updated_at"].isoformat() if row["updated_at"] else None,
-        })
-    return JSONResponse(threads)
+async def list_threads() -> Response:
+    # LATERAL instead of a correlated subquery in the select list: the
+    # planner runs one short index probe per thread row rather than
+    # re-planning a nested subquery per row (idx_conversations_thread_role_id
+    # makes each probe a single descent).
+    rows = await state.pool.fetch(_SQL_LIST_THREADS)
+    # The SELECT list already matches the wire shape, so each Record converts
+    # straight to a dict in C — no per-key rebuild, and orjson encodes the
+    # datetimes natively
+    body = orjson.dumps([dict(r) for r in rows])
+    return Response(body, media_type="application/json")
 
 
 @app.post("/api/threads")
-async def create_thread() -> JSONResponse:
+async def create_thread() -> ORJSONResponse:
     row = await state.pool.fetchrow(
         "INSERT INTO conversation_threads (title) VALUES ('New conversation') RETURNING id, title, created_at, updated_at"
     )
-    return JSONResponse({
+    return ORJSONResponse({
         "id": row["id"],
         "title": row["title"],
-        "created_at": row["created_at"].isoformat(),
-        "updated_at": row["updated_at"].isoformat(),
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
     })
 
 
 @app.patch("/api/threads/{thread_id}")
-async def update_thread(thread_id: int, body: dict[str, Any]) -> JSONResponse:
+async def update_thread(thread_id: int, body: dict[str, Any]) -> ORJSONResponse:
     title = body.get("title")
     if title:
-        await state.pool.execute(
-            "UPDATE conversation_threads SET title = $1, updated_at = now() WHERE id = $2",
+        # RETURNING folds the write and the read-back into one round-trip
+        row = await state.pool.fetchrow(
+            "UPDATE conversation_threads SET title = $1, updated_at = now() "
+            "WHERE id = $2 RETURNING id, title, created_at, updated_at",
             title, thread_id,
         )
-    row = await state.pool.fetchrow(
-        "SELECT id, title, created_at, updated_at FROM conversation_threads WHERE id = $1", thread_id
-    )
+    else:
+        row = await state.pool.fetchrow(
+            "SELECT id, title, created_at, updated_at FROM conversation_threads WHERE id = $1",
+            thread_id,
+        )
     if not row:
-        return JSONResponse({"error": "not found"}, status_code=404)
-    return JSONResponse({
+        return ORJSONResponse({"error": "not found"}, status_code=404)
+    return ORJSONResponse({
         "id": row["id"],
         "title": row["title"],
-        "created_at": row["created_at"].isoformat(),
-        "updated_at": row["updated_at"].isoformat(),
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
     })
 
 
 @app.delete("/api/threads/{thread_id}")
-async def delete_thread(thread_id: int) -> JSONResponse:
-    await state.pool.execute("DELETE FROM conversations WHERE thread_id = $1", thread_id)
-    await state.pool.execute("DELETE FROM conversation_threads WHERE id = $1", thread_id)
-    return JSONResponse({"ok": True})
+async def delete_thread(thread_id: int) -> ORJSONResponse:
+    # Both deletes in one statement: one round-trip, and the data-modifying
+    # CTE runs atomically with the outer delete.
+    await state.pool.execute(
+        "WITH d AS (DELETE FROM conversations WHERE thread_id = $1) "
+        "DELETE FROM conversation_threads WHERE id = $1",
+        thread_id,
+    )
+    return ORJSONResponse({"ok": True})
 
 
 # ── Chat history API (scoped to thread) ──
 
-@app.get("/api/threads/{thread_id}/history")
-async def get_thread_history(thread_id: int) -> JSONResponse:
-    rows = await state.pool.fetch(
-        "SELECT role, content, tool_call_id, tool_calls, created_at "
-        "FROM conversations WHERE thread_id = $1 ORDER BY id DESC LIMIT 200",
-        thread_id,
-    )
+# Serialized history bodies keyed by thread, tagged with the thread's max
+# conversation id.  A MAX(id) probe (single index descent) decides whether
+# the cached bytes are still current — no explicit invalidation hooks, so
+# writes from any path (agent, execute_sql) are picked up automatically.
+_history_cache: dict[int, tuple[int | None, bytes]] = {}
+_HISTORY_CACHE_MAX = 64
+
+
+async def _thread_history_response(thread_id: int, last_id: int | None) -> Response:
+    cached = _history_cache.get(thread_id)
+    if cached is not None and cached[0] == last_id:
+        return Response(cached[1], media_type="application/json")
+
+    rows = await state.pool.fetch(_SQL_HISTORY, thread_id)
     rows = list(reversed(rows))
-    events = _rows_to_events(rows)
-    return JSONResponse(events)
+    body = orjson.dumps(_rows_to_events(rows))
+
+    if thread_id not in _history_cache and len(_history_cache) >= _HISTORY_CACHE_MAX:
+        _history_cache.pop(next(iter(_history_cache)))
+    _history_cache[thread_id] = (last_id, body)
+    return Response(body, media_type="application/json")
+
+
+@app.get("/api/threads/{thread_id}/history")
+async def get_thread_history(thread_id: int) -> Response:
+    last_id: int | None = await state.pool.fetchval(_SQL_MAX_CONV_ID, thread_id)
+    return await _thread_history_response(thread_id, last_id)
 
 
 @app.get("/api/history")
-async def get_history() -> JSONResponse:
+async def get_history() -> Response:
     """Legacy endpoint — returns most recent thread's history."""
+    # One round-trip resolves the most recent thread and its max message id
+    # (the cache-validation tag) together
     row = await state.pool.fetchrow(
-        "SELECT id FROM conversation_threads ORDER BY updated_at DESC LIMIT 1"
+        "WITH t AS (SELECT id FROM conversation_threads ORDER BY updated_at DESC LIMIT 1) "
+        "SELECT t.id AS thread_id, "
+        "  (SELECT MAX(c.id) FROM conversations c WHERE c.thread_id = t.id) AS last_id "
+        "FROM t"
     )
     if not row:
-        return JSONResponse([])
-    rows = await state.pool.fetch(
-        "SELECT role, content, tool_call_id, tool_calls, created_at "
-        "FROM conversations WHERE thread_id = $1 ORDER BY id DESC LIMIT 200",
-        row["id"],
-    )
-    rows = list(reversed(rows))
-    events = _rows_to_events(rows)
-    return JSONResponse(events)
+        return ORJSONResponse([])
+    return await _thread_history_response(row["thread_id"], row["last_id"])
 
 
 def _rows_to_events(rows: list[asyncpg.Record]) -> list[dict[str, Any]]:
+    """Convert history rows (role, content, tool_call_id, tool_calls, created_at)
+    into UI events.  Rows are tuple-unpacked in that column order — Record
+    iteration yields values in C, skipping five __getitem__ calls per row.
+    """
     events: list[dict[str, Any]] = []
-    for row in rows:
-        role = row["role"]
-        content = row["content"] or ""
-        tool_calls_raw = row["tool_calls"]
+    # tool_call_id -> function name, so tool rows resolve their originating
+    # call in O(1) instead of re-scanning the built event list per row
+    call_names: dict[str, str] = {}
+    last_tool_name = ""
+    for role, content, tool_call_id, tool_calls_raw, _created_at in rows:
+        content = content or ""
 
         if role == "user":
             events.append({"type": "user", "content": content})
         elif role == "assistant":
             if tool_calls_raw:
-                tc_list = (
-                    json.loads(tool_calls_raw)
-                    if isinstance(tool_calls_raw, str)
-                    else tool_calls_raw
-                )
-                for tc in tc_list:
+                # The pool's jsonb codec decodes the column on read, so this
+                # is already a list of dicts
+                for tc in tool_calls_raw:
                     fn_name = tc["function"]["name"]
-                    fn_args_str = tc["function"]["arguments"]
-                    try:
-                        fn_args = json.loads(fn_args_str)
-                    except (json.JSONDecodeError, TypeError):
-                        fn_args = {}
+                    tc_id = tc.get("id")
+                    if tc_id:
+                        call_names[tc_id] = fn_name
+                    last_tool_name = fn_name
+                    # Ship the arguments as the raw JSON string only — the
+                    # browser parses it natively on demand, so there's no
+                    # point decoding (and double-shipping) it here
                     events.append({
                         "type": "tool_call",
                         "name": fn_name,
-                        "content": fn_args_str,
-                        "arguments": fn_args,
+                        "content": tc["function"]["arguments"],
                     })
             else:
                 events.append({"type": "assistant", "content": content})
         elif role == "tool":
-            tool_name = ""
-            for prev in reversed(events):
-                if prev.get("type") == "tool_call":
-                    tool_name = prev.get("name", "")
-                    break
+            # Match by call id when present (handles parallel tool calls);
+            # fall back to the most recent call name
+            tool_name = call_names.get(tool_call_id, last_tool_name)
             events.append({"type": "tool_result", "name": tool_name, "content": content})
 
     return events
@@ -222,24 +326,70 @@ def _rows_to_events(rows: list[asyncpg.Record]) -> list[dict[str, Any]]:
 
 # ── WebSocket chat (thread-aware) ──
 
+async def _ws_send(websocket: WebSocket, payload: dict[str, Any]) -> None:
+    # send_text with orjson — FastAPI's send_json serializes via stdlib json
+    await websocket.send_text(orjson.dumps(payload).decode())
+
+
+# Coalescing bounds for agent-event bursts: flush a batch once it has this
+# many events, or once the stream has been idle this long.
+_BATCH_MAX_EVENTS = 16
+_BATCH_MAX_DELAY = 0.01
+
+# Inbound frames up to this size parse inline; anything bigger (pasted
+# documents, bulk tool payloads) goes to a worker thread so one giant
+# message can't stall every other connection on the loop.
+_INLINE_PARSE_LIMIT = 4096
+
+
+async def _ws_send_batch(websocket: WebSocket, events: list[dict[str, Any]]) -> None:
+    if len(events) == 1:
+        await _ws_send(websocket, events[0])
+    else:
+        await _ws_send(websocket, {"type": "batch", "events": events})
+
+
+async def _pump_events(
+    agen: AsyncGenerator[AgentEvent],
+    queue: asyncio.Queue[dict[str, Any] | None],
+) -> None:
+    try:
+        async for event in agen:
+            payload: dict[str, Any] = {"type": event.type, "content": event.content}
+            if event.name:
+                payload["name"] = event.name
+            if event.arguments:
+                payload["arguments"] = event.arguments
+            await queue.put(payload)
+    finally:
+        await queue.put(None)
+
+
 @app.websocket("/chat")
 async def chat_endpoint(websocket: WebSocket) -> None:
     await websocket.accept()
     thread_id: int | None = None
+    # True once we know the thread has a user message (and thus a title) —
+    # lets every message after the first skip the auto-title check entirely.
+    thread_titled = False
 
     try:
         while True:
             data = await websocket.receive_text()
             try:
-                msg = json.loads(data)
-            except json.JSONDecodeError:
-                await websocket.send_json({"type": "error", "content": "Invalid JSON"})
+                if len(data) < _INLINE_PARSE_LIMIT:
+                    msg = orjson.loads(data)
+                else:
+                    msg = await asyncio.to_thread(orjson.loads, data)
+            except orjson.JSONDecodeError:
+                await _ws_send(websocket, {"type": "error", "content": "Invalid JSON"})
                 continue
 
             # Handle thread selection
             if msg.get("type") == "set_thread":
                 thread_id = msg.get("thread_id")
-                await websocket.send_json({"type": "thread_set", "thread_id": thread_id})
+                thread_titled = False
+                await _ws_send(websocket, {"type": "thread_set", "thread_id": thread_id})
                 continue
 
             content = msg.get("content", "")
@@ -252,29 +402,62 @@ async def chat_endpoint(websocket: WebSocket) -> None:
                     "INSERT INTO conversation_threads (title) VALUES ('New conversation') RETURNING id"
                 )
                 thread_id = row["id"]
-                await websocket.send_json({"type": "thread_created", "thread_id": thread_id})
-
-            # Auto-title: use first user message as title
-            msg_count = await state.pool.fetchval(
-                "SELECT COUNT(*) FROM conversations WHERE thread_id = $1 AND role = 'user'",
-                thread_id,
-            )
-            if msg_count == 0:
-                title = content[:80] + ("..." if len(content) > 80 else "")
-                await state.pool.execute(
-                    "UPDATE conversation_threads SET title = $1 WHERE id = $2",
-                    title, thread_id,
+                await _ws_send(websocket, {"type": "thread_created", "thread_id": thread_id})
+
+            # Auto-title: use first user message as title.  EXISTS
+            # short-circuits at the first matching row (vs COUNT(*) scanning
+            # the whole thread), and the session flag means the check only
+            # runs once per selected thread.
+            if not thread_titled:
+                has_user_msg = await state.pool.fetchval(_SQL_HAS_USER_MSG, thread_id)
+                if not has_user_msg:
+                    title = content[:80] + ("..." if len(content) > 80 else "")
+                    await state.pool.execute(
+                        "UPDATE conversation_threads SET title = $1 WHERE id = $2",
+                        title, thread_id,
+                    )
+                    await _ws_send(
+                        websocket,
+                        {"type": "thread_updated", "thread_id": thread_id, "title": title},
+                    )
+                thread_titled = True
+
+            # Agent events are pumped into a queue by a side task and
+            # coalesced here — bursts of small events (streamed tokens, tool
+            # progress) go out as one frame instead of one syscall each.
+            queue: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue()
+            pump = asyncio.create_task(
+                _pump_events(
+                    handle_message(content, state.pool, state.client, settings, thread_id),
+                    queue,
                 )
-                await websocket.send_json({"type": "thread_updated", "thread_id": thread_id, "title": title})
-
-            event: AgentEvent
-            async for event in handle_message(content, state.pool, state.client, settings, thread_id):
-                payload: dict[str, Any] = {"type": event.type, "content": event.content}
-                if event.name:
-                    payload["name"] = event.name
-                if event.arguments:
-                    payload["arguments"] = event.arguments
-                await websocket.send_json(payload)
+            )
+            try:
+                buf: list[dict[str, Any]] = []
+                while True:
+                    if buf:
+                        try:
+                            item = await asyncio.wait_for(
+                                queue.get(), timeout=_BATCH_MAX_DELAY
+                            )
+                        except TimeoutError:
+                            await _ws_send_batch(websocket, buf)
+                            buf = []
+                            continue
+                    else:
+                        item = await queue.get()
+                    if item is None:
+                        break
+                    buf.append(item)
+                    if len(buf) >= _BATCH_MAX_EVENTS:
+                        await _ws_send_batch(websocket, buf)
+                        buf = []
+                if buf:
+                    await _ws_send_batch(websocket, buf)
+                await pump
+            finally:
+                if not pump.done():
+                    pump.cancel()
 
     except WebSocketDisconnect:
         logger.info("Client disconnected")